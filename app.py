@@ -1,119 +1,199 @@
 # ------------------------------- app.py --------------------------------
-import os
+import hashlib
 import io
+import json
 import uuid
-import socket
+import wave
 from datetime import datetime, timezone
-from urllib.parse import urlparse
 from pathlib import Path
-from typing import List
-import streamlit as st
-from supabase import create_client, Client
-from openai import OpenAI
-
 
+import streamlit as st
 
+from supabase_helpers import get_supabase, probe_supabase
+from survey_options import (
+    AUDIO_UPLOAD_TYPES,
+    BRIGHTNESS_OPTIONS,
+    COMFORT_OPTIONS,
+    FEEDBACK_INFLUENCE_OPTIONS,
+    GLARE_COLORS,
+    GLARE_DISCOMFORT,
+    GLARE_LEVELS,
+    PARTICIPANT_TYPES,
+    THERMAL_LABELS,
+    THERMAL_PREFERENCE_OPTIONS,
+    TIME_IN_SPACE_OPTIONS,
+    YES_NO,
+    thermal_color,
+)
+from ui_helpers import THERMAL_LEGEND_HTML, chip, chip_html, metric_cards
 
 # ---------- Page & Secrets ----------
 st.set_page_config(page_title="Comfort Feedback", page_icon="📝", layout="centered")
 
-SUPABASE_URL = st.secrets["SUPABASE_URL"].strip().rstrip("/")
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"].strip()
-SUPABASE_BUCKET = st.secrets.get("SUPABASE_BUCKET", "voice-recordings")
-FEEDBACK_TABLE = st.secrets.get("SUPABASE_TABLE", "feedback")
+# Secrets are read and normalised once per process, not on every rerun
+# (edits to secrets.toml need a restart or cache clear to take effect).
+@st.cache_resource
+def _settings() -> tuple:
+    s = st.secrets
+    return (
+        s["SUPABASE_URL"].strip().rstrip("/"),
+        s.get("SUPABASE_BUCKET", "voice-recordings"),
+        s.get("SUPABASE_TABLE", "feedback"),
+        int(s.get("MAX_AUDIO_MB", 2)),
+    )
+
+(
+    SUPABASE_URL,
+    SUPABASE_BUCKET,
+    FEEDBACK_TABLE,
+    MAX_AUDIO_MB,
+) = _settings()
 TABLE = FEEDBACK_TABLE
+MAX_AUDIO_BYTES = MAX_AUDIO_MB * 1024 * 1024
 
 BASE_DIR = Path(__file__).resolve().parent
 
 # ---------- Load custom CSS ----------
-def load_css():
+# The stylesheet doesn't change while the server runs: stat and read it once
+@st.cache_resource(show_spinner=False)
+def _css_block() -> str | None:
     css_path = BASE_DIR / "style.css"
-    if css_path.exists():
-        with open(css_path, "r", encoding="utf-8") as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+    if not css_path.exists():
+        return None
+    return f"<style>{css_path.read_text(encoding='utf-8')}</style>"
+
+def load_css():
+    css = _css_block()
+    if css:
+        st.markdown(css, unsafe_allow_html=True)
 
 load_css()
 
 # ---------- Supabase ----------
+# The shared client (supabase_helpers.get_supabase) is created by the probe
+# after the title renders.
+# Table/bucket handles are stateless builders; each .select()/.insert()/
+# .upload() call starts a fresh request, so one handle per process is enough.
 @st.cache_resource
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-supabase = get_supabase()
+def get_table():
+    return get_supabase().table(TABLE)
 
-try:
-    host = urlparse(SUPABASE_URL).hostname or ""
-    _ = socket.gethostbyname(host)
-    supabase.table(TABLE).select("id").limit(1).execute()
-except Exception as e:
-    st.error(f"❌ Supabase probe failed: {e}")
+@st.cache_resource
+def get_bucket():
+    return get_supabase().storage.from_(SUPABASE_BUCKET)
 
 # ---------- Optional audio recorder ----------
-try:
-    from audio_recorder_streamlit import audio_recorder
-    HAS_AUDIOREC = True
-except Exception:
-    HAS_AUDIOREC = False
-
-# ---------- UI helpers ----------
-def gradient_legend(colors: List[str], labels: List[str], height: int = 10):
-    bar = f"linear-gradient(90deg, {', '.join(colors)})"
-    ticks = "".join([f"<span>{lbl}</span>" for lbl in labels])
-    st.markdown(
-        f"""
-        <div style="margin:6px 2px 2px 2px;">
-          <div style="width:100%;height:{height}px;border-radius:8px;background:{bar};
-                      box-shadow: inset 0 0 0 1px rgba(0,0,0,0.06);"></div>
-          <div style="display:flex;justify-content:space-between;font-size:0.8rem;
-                      opacity:0.75;margin-top:4px;">
-            {ticks}
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-def chip(color: str, text: str, icon: str = "") -> None:
-    st.markdown(
-        f"""
-        <div style="display:inline-flex;align-items:center;gap:8px;padding:8px 10px;margin:6px 0;
-                    border-radius:999px;background:rgba(0,0,0,0.03);
-                    border:1px solid rgba(0,0,0,0.05)">
-          <span style="width:12px;height:12px;border-radius:50%;background:{color};
-                       border:1px solid rgba(0,0,0,.1)"></span>
-          <span style="font-size:.9rem;opacity:.85">{icon} {text}</span>
-        </div>
-        """,
-        unsafe_allow_html=True,
+# Probed once per process rather than on every rerun.
+@st.cache_resource
+def _optional_deps() -> dict:
+    out = {}
+    try:
+        from audio_recorder_streamlit import audio_recorder
+        out["audio_recorder"] = audio_recorder
+    except Exception:
+        out["audio_recorder"] = None
+    try:
+        from pydub import AudioSegment
+        out["AudioSegment"] = AudioSegment
+    except Exception:
+        out["AudioSegment"] = None
+    return out
+
+# Static images are read from disk once per process; st.image then gets the
+# cached bytes instead of re-reading the file on every rerun.
+@st.cache_resource(show_spinner=False)
+def load_image_bytes(path: str):
+    try:
+        return Path(path).read_bytes()
+    except OSError:
+        return None
+
+# Fingerprint of a submission, ignoring the per-click id/timestamp, so an
+# accidental double-submit can be recognised before any network call.
+def submission_hash(payload: dict, audio: bytes | memoryview | None) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    stable = {k: v for k, v in payload.items() if k not in ("id", "timestamp")}
+    h.update(json.dumps(stable, sort_keys=True, default=str).encode())
+    if audio:
+        h.update(audio)
+    return h.digest()
+
+# Duration from the WAV header, read once at submit time; other formats (or a
+# header wave can't parse) leave audio_seconds to the table default.
+def wav_seconds(data: bytes | memoryview) -> float | None:
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            return round(w.getnframes() / w.getframerate(), 2)
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+# The clip is small and already in memory, so it goes to storage3 as bytes;
+# only the uploader's zero-copy memoryview needs converting.
+def upload_audio(bucket, path: str, data: bytes | memoryview, mime: str) -> None:
+    bucket.upload(
+        path=path,
+        file=data if isinstance(data, bytes) else bytes(data),
+        file_options={"content-type": mime, "x-upsert": "true"},
     )
 
-def metric_card(title: str, value: str, sub: str = "", icon: str = ""):
-    st.markdown(
-        f"""
-        <div style="border:1px solid rgba(0,0,0,0.06);border-radius:16px;padding:14px 16px;
-                    background:white;box-shadow:0 1px 2px rgba(0,0,0,0.04);">
-          <div style="font-size:.8rem;opacity:.7;margin-bottom:6px;">{icon} {title}</div>
-          <div style="font-weight:700;font-size:1.2rem">{value}</div>
-          <div style="font-size:.8rem;opacity:.6">{sub}</div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+# Speech at 32 kbps Opus sounds the same as 16-bit PCM and is ~40x smaller.
+# Needs pydub + ffmpeg (packages.txt); any failure keeps the original WAV.
+def wav_to_opus(segment_cls, data: bytes | memoryview) -> bytes | None:
+    if segment_cls is None:
+        return None
+    try:
+        out = io.BytesIO()
+        segment_cls.from_wav(io.BytesIO(data)).export(out, format="ogg", codec="libopus", bitrate="32k")
+        return out.getvalue()
+    except Exception:
+        return None
+
+# Clip paths are content hashes, so a listing hit means the same bytes are
+# already in the bucket and the upload can be skipped.
+def already_stored(bucket, path: str) -> bool:
+    folder, _, name = path.rpartition("/")
+    try:
+        found = bucket.list(folder, {"search": name, "limit": 1})
+    except Exception:
+        return False
+    return any(f.get("name") == name for f in found or [])
+
+AUDIO_COLUMNS = ("audio_path", "audio_mime", "audio_seconds", "voice_transcript")
+
+# Stores the clip before its row is written: WAV clips are re-encoded to Opus
+# first (payload's audio_path/audio_mime follow), and bytes already in the
+# bucket are not sent again. Upload errors propagate to the caller.
+def store_clip(bucket, payload: dict, data, mime: str, segment_cls=None) -> None:
+    if mime == "audio/wav":
+        opus = wav_to_opus(segment_cls, data)
+        if opus is not None:
+            data, mime = opus, "audio/ogg"
+            payload["audio_path"] = payload["audio_path"].rsplit(".", 1)[0] + ".ogg"
+            payload["audio_mime"] = mime
+    if not already_stored(bucket, payload["audio_path"]):
+        upload_audio(bucket, payload["audio_path"], data, mime)
 
 # ---------- Title ----------
-st.markdown("""
+st.html("""
 <div class="app-title">📝 Indoor Environmental Quality Feedback</div>
 <div class="app-subtitle">
 Share your thermal, visual, and work-related experience in this space.
 </div>
-""", unsafe_allow_html=True)
+""")
+
+# Once the probe has passed this session, widget reruns skip it entirely;
+# a failure leaves the flag unset so the next rerun retries.
+if not st.session_state.get("sb_ok"):
+    try:
+        probe_supabase(get_supabase(), SUPABASE_URL, TABLE)
+        st.session_state["sb_ok"] = True
+    except Exception as e:
+        st.error(f"❌ Supabase probe failed: {e}")
 
 # ---------- Seat / Grid Location ----------
-st.markdown('<div class="section-card">', unsafe_allow_html=True)
-st.markdown('<div class="section-heading">Seat / Grid Location</div>', unsafe_allow_html=True)
-st.markdown(
-    '<div class="section-caption">Please select the number that matches where you are sitting.</div>',
-    unsafe_allow_html=True
+st.html(
+    '<div class="section-heading">Seat / Grid Location</div>'
+    '<div class="section-caption">Please select the number that matches where you are sitting.</div>'
 )
 
 st.caption(
@@ -121,8 +201,9 @@ st.caption(
 )
 
 GRID_IMAGE = str(BASE_DIR / "assets" / "clo_images" / "grid_numbered_plan.png")
-if os.path.exists(GRID_IMAGE):
-    st.image(GRID_IMAGE, caption="Sample numbered seating/grid map", use_column_width=True)
+grid_image = load_image_bytes(GRID_IMAGE)
+if grid_image is not None:
+    st.image(grid_image, caption="Sample numbered seating/grid map", use_column_width=True)
 else:
     st.warning("Grid image not found.")
 
@@ -131,315 +212,386 @@ grid_number = st.number_input(
     min_value=1,
     max_value=120,
     value=1,
-    step=1
+    step=1,
+    key="fb_grid_number",
 )
 
 st.subheader("Participant type")
 participant_type = st.radio(
     "How should this response be recorded?",
-    ["Core group", "Visitor"],
+    PARTICIPANT_TYPES,
     horizontal=True,
-    help="Core group = repeated participants for main analysis. Visitor = occasional user."
+    help="Core group = repeated participants for main analysis. Visitor = occasional user.",
+    key="fb_participant_type",
 )
 
 c1, c2 = st.columns(2)
 with c1:
-    room = st.text_input("Room/Location (optional)")
+    room = st.text_input("Room/Location (optional)", key="fb_room")
 
 with c2:
     if participant_type == "Core group":
         user_id = st.text_input(
             "User ID or anonymous code (optional)",
-            placeholder="e.g., P07 or A12"
+            placeholder="e.g., P07 or A12",
+            key="fb_user_id",
         )
     else:
         user_id = "visitor"
         st.text_input("User ID", value="visitor", disabled=True)
 
-st.markdown('</div>', unsafe_allow_html=True)
-st.markdown("---")
-
-# ---------- 1) Thermal Comfort ----------
-st.header("1) Thermal Comfort")
+st.divider()
+
+# Sections 1-4 and the summary cards form one fragment: dragging a slider
+# reruns only this block, not the seat map, voice recorder or LLM section.
+# The answers are published to session_state for the submit handler.
+@st.fragment
+def _ratings_fragment(grid_number: int) -> None:
+    # ---------- 1) Thermal Comfort ----------
+    st.header("1) Thermal Comfort")
+
+    thermal_sensation = st.slider(
+        "How do you feel right now?",
+        min_value=-3,
+        max_value=3,
+        value=0,
+        help="-3 Cold · -2 Cool · -1 Slightly cool · 0 Neutral · +1 Slightly warm · +2 Warm · +3 Hot",
+        key="fb_thermal_sensation",
+    )
 
-thermal_sensation = st.slider(
-    "How do you feel right now?",
-    min_value=-3,
-    max_value=3,
-    value=0,
-    help="-3 Cold · -2 Cool · -1 Slightly cool · 0 Neutral · +1 Slightly warm · +2 Warm · +3 Hot",
-)
+    # Legend and current-value chip go out as one HTML element
+    st.html(
+        THERMAL_LEGEND_HTML
+        + chip_html(
+            thermal_color(thermal_sensation),
+            f"{THERMAL_LABELS[thermal_sensation]} ({thermal_sensation})",
+            "🌡️",
+        )
+    )
 
-thermal_sensation_labels = {
-    -3: "Cold",
-    -2: "Cool",
-    -1: "Slightly cool",
-     0: "Neutral",
-     1: "Slightly warm",
-     2: "Warm",
-     3: "Hot",
-}
-
-gradient_legend(
-    ["#1e3a8a 0%", "#2563eb 16.6%", "#60a5fa 33.3%", "#e5e7eb 50%", "#fdba74 66.6%", "#f97316 83.3%", "#dc2626 100%"],
-    ["Cold", "Cool", "Slightly cool", "Neutral", "Slightly warm", "Warm", "Hot"],
-)
+    thermal_comfort = st.radio(
+        "Are you comfortable?",
+        COMFORT_OPTIONS,
+        horizontal=True,
+        key="fb_thermal_comfort",
+    )
 
-chip(
-    {-3: "#1e3a8a", -2: "#2563eb", -1: "#60a5fa", 0: "#e5e7eb", 1: "#fdba74", 2: "#f97316", 3: "#dc2626"}[thermal_sensation],
-    f"{thermal_sensation_labels[thermal_sensation]} ({thermal_sensation})",
-    "🌡️",
-)
+    thermal_preference = st.radio(
+        "Would you prefer it to be:",
+        THERMAL_PREFERENCE_OPTIONS,
+        horizontal=True,
+        key="fb_thermal_preference",
+    )
 
-thermal_comfort = st.radio(
-    "Are you comfortable?",
-    ["Comfortable", "Slightly uncomfortable", "Uncomfortable"],
-    horizontal=True,
-)
+    st.divider()
 
-thermal_preference = st.radio(
-    "Would you prefer it to be:",
-    ["Cooler", "No change", "Warmer"],
-    horizontal=True,
-)
+    # ---------- 2) Visual Comfort ----------
+    st.header("2) Visual Comfort")
 
-st.markdown("---")
+    brightness = st.radio(
+        "How is the light level at your current workspace?",
+        BRIGHTNESS_OPTIONS,
+        horizontal=True,
+        key="fb_brightness",
+    )
 
-# ---------- 2) Visual Comfort ----------
-st.header("2) Visual Comfort")
+    glare_level = st.radio(
+        "Do you experience glare?",
+        GLARE_LEVELS,
+        horizontal=True,
+        key="fb_glare_level",
+    )
 
-brightness = st.radio(
-    "How is the light level at your current workspace?",
-    ["Too dim", "Comfortable", "Too bright"],
-    horizontal=True,
-)
+    chip(GLARE_COLORS[glare_level], f"Glare = {glare_level}", "👀")
 
-glare_level = st.radio(
-    "Do you experience glare?",
-    ["None", "Slight", "Moderate", "Severe"],
-    horizontal=True,
-)
+    visual_comfort = st.radio(
+        "How comfortable is the lighting for your task?",
+        COMFORT_OPTIONS,
+        horizontal=True,
+        key="fb_visual_comfort",
+    )
 
-glare_colors = {
-    "None": "#16a34a",
-    "Slight": "#84cc16",
-    "Moderate": "#f59e0b",
-    "Severe": "#ef4444",
-}
-chip(glare_colors[glare_level], f"Glare = {glare_level}", "👀")
-
-visual_comfort = st.radio(
-    "How comfortable is the lighting for your task?",
-    ["Comfortable", "Slightly uncomfortable", "Uncomfortable"],
-    horizontal=True,
-)
+    st.divider()
 
-st.markdown("---")
+    # ---------- 3) Task Impact ----------
+    st.header("3) Task Impact")
 
-# ---------- 3) Task Impact ----------
-st.header("3) Task Impact")
+    task_interference = st.radio(
+        "Does the environment affect your ability to work?",
+        YES_NO,
+        horizontal=True,
+        key="fb_task_interference",
+    )
 
-task_interference = st.radio(
-    "Does the environment affect your ability to work?",
-    ["Yes", "No"],
-    horizontal=True,
-)
+    task_interference_note = None
+    if task_interference == "Yes":
+        task_interference_note = st.text_area(
+            "If yes, please explain:",
+            placeholder="e.g., glare on screen, warm air, low light on desk...",
+            key="fb_task_interference_note",
+        )
 
-task_interference_note = None
-if task_interference == "Yes":
-    task_interference_note = st.text_area(
-        "If yes, please explain:",
-        placeholder="e.g., glare on screen, warm air, low light on desk..."
+    concentration = st.slider(
+        "How well can you concentrate right now?",
+        min_value=0,
+        max_value=10,
+        value=5,
+        help="0 = Very poorly · 10 = Very well",
+        key="fb_concentration",
     )
 
-concentration = st.slider(
-    "How well can you concentrate right now?",
-    min_value=0,
-    max_value=10,
-    value=5,
-    help="0 = Very poorly · 10 = Very well",
-)
-
-productivity = st.slider(
-    "How would you rate your productivity in this environment?",
-    min_value=0,
-    max_value=10,
-    value=5,
-    help="0 = Very low · 10 = Very high",
-)
+    productivity = st.slider(
+        "How would you rate your productivity in this environment?",
+        min_value=0,
+        max_value=10,
+        value=5,
+        help="0 = Very low · 10 = Very high",
+        key="fb_productivity",
+    )
 
-st.markdown("---")
+    st.divider()
 
-# ---------- 4) Time in Space ----------
-st.header("4) Time in Space")
+    # ---------- 4) Time in Space ----------
+    st.header("4) Time in Space")
 
-time_in_space = st.radio(
-    "How long have you been in this space?",
-    [
-        "Less than 15 minutes",
-        "15–60 minutes",
-        "1–3 hours",
-        "More than 3 hours",
-    ],
-    horizontal=True,
-)
+    time_in_space = st.radio(
+        "How long have you been in this space?",
+        TIME_IN_SPACE_OPTIONS,
+        horizontal=True,
+        key="fb_time_in_space",
+    )
 
-st.markdown("---")
+    st.divider()
+
+    # ---------- Summary cards ----------
+    st.subheader("Now")
+    metric_cards([
+        ("Seat", str(grid_number), "grid number", "📍"),
+        ("Thermal", f"{thermal_sensation}", THERMAL_LABELS[thermal_sensation], "🌡️"),
+        ("Visual", visual_comfort, "lighting comfort", "👀"),
+        ("Focus", f"{concentration}/10", "current concentration", "🧠"),
+        ("Time", time_in_space, "duration in space", "⏱️"),
+    ])
+
+    st.divider()
+
+    st.session_state["ratings"] = {
+        "thermal_sensation": thermal_sensation,
+        "thermal_comfort": thermal_comfort,
+        "thermal_preference": thermal_preference,
+        "brightness": brightness,
+        "glare_level": glare_level,
+        "visual_comfort": visual_comfort,
+        "task_interference": task_interference,
+        "task_interference_note": task_interference_note,
+        "concentration": concentration,
+        "productivity": productivity,
+        "time_in_space": time_in_space,
+    }
+
+_ratings_fragment(int(grid_number))
+ratings = st.session_state["ratings"]
+thermal_sensation = ratings["thermal_sensation"]
+thermal_comfort = ratings["thermal_comfort"]
+thermal_preference = ratings["thermal_preference"]
+brightness = ratings["brightness"]
+glare_level = ratings["glare_level"]
+visual_comfort = ratings["visual_comfort"]
+task_interference = ratings["task_interference"]
+task_interference_note = ratings["task_interference_note"]
+concentration = ratings["concentration"]
+productivity = ratings["productivity"]
+time_in_space = ratings["time_in_space"]
 
-# ---------- Summary cards ----------
 visual_discomfort_flag = (
     visual_comfort != "Comfortable"
-    or glare_level in ["Moderate", "Severe"]
+    or glare_level in GLARE_DISCOMFORT
 )
 
-st.subheader("Now")
-mc1, mc2, mc3, mc4, mc5 = st.columns(5)
-
-with mc1:
-    metric_card("Seat", str(grid_number), "grid number", "📍")
-with mc2:
-    metric_card("Thermal", f"{thermal_sensation}", thermal_sensation_labels[thermal_sensation], "🌡️")
-with mc3:
-    metric_card("Visual", visual_comfort, "lighting comfort", "👀")
-with mc4:
-    metric_card("Focus", f"{concentration}/10", "current concentration", "🧠")
-with mc5:
-    metric_card("Time", time_in_space, "duration in space", "⏱️")
-
-st.markdown("---")
-
-
 # ---------- 5) Open-ended Feedback ----------
 st.header("5) Open-ended Feedback")
 st.caption("You can briefly describe your experience in text and optionally record or upload a voice note.")
 
-st.subheader("Brief description")
-open_feedback_text = st.text_area(
-    "Can you briefly describe your experience?",
-    placeholder="Examples:\n• Sunlight is hitting my screen\n• It feels stuffy\n• Too bright near the window",
-    height=120,
-)
-
-feedback_influence = st.radio(
-    "Did others’ feedback influence your response?",
-    ["Not at all", "Slightly", "Moderately", "Strongly"],
-    horizontal=True,
-)
-
-st.markdown("---")
-
-st.subheader("Voice note (optional)")
-st.caption("You can record a short voice note or upload an audio file.")
+# Recording or uploading a clip reruns only this fragment; the clip is
+# handed to the submit handler through session_state.
+@st.fragment
+def _voice_note_fragment() -> None:
+    st.subheader("Voice note (optional)")
+    st.caption("You can record a short voice note or upload an audio file.")
+
+    audio_bytes = None
+    audio_mime = "audio/wav"
+    audio_ext = ".wav"
+
+    audio_recorder = _optional_deps()["audio_recorder"]
+    HAS_AUDIOREC = audio_recorder is not None
+
+    if HAS_AUDIOREC:
+        st.subheader("Record directly")
+        raw = audio_recorder(
+            text="Click to record / stop",
+            recording_color="#ef4444",
+            neutral_color="#e5e7eb",
+            icon_size="2x",
+            key="voice_recorder_a",
+        )
 
+        if raw is not None:
+            if len(raw) > MAX_AUDIO_BYTES:
+                st.error(f"Recording is too long ({len(raw)} bytes); please keep it under {MAX_AUDIO_MB} MB.")
+            else:
+                audio_bytes = raw
+                st.success(f"Recorded successfully: {len(audio_bytes)} bytes")
+                st.audio(audio_bytes, format=audio_mime)
 
+    st.subheader("Or upload an audio file")
+    upload = st.file_uploader("Upload voice note (wav/mp3/m4a)", type=AUDIO_UPLOAD_TYPES, key="fb_upload")
 
-audio_bytes = None
-audio_mime = "audio/wav"
-audio_seconds = None
+    if upload is not None:
+        if upload.size > MAX_AUDIO_BYTES:
+            st.error(f"File is too large ({upload.size} bytes); please keep it under {MAX_AUDIO_MB} MB.")
+        else:
+            # zero-copy view of the uploaded buffer; the preview reads the file itself
+            audio_bytes = upload.getbuffer()
+            audio_mime = upload.type or "audio/wav"
+            # the stored object keeps the uploaded file's own extension
+            audio_ext = Path(upload.name).suffix.lower() or ".wav"
+            st.success(f"Uploaded file: {len(audio_bytes)} bytes")
+            st.audio(upload, format=audio_mime)
+
+    st.session_state["voice_note"] = (audio_bytes, audio_mime, audio_ext)
+
+_voice_note_fragment()
+audio_bytes, audio_mime, audio_ext = st.session_state["voice_note"]
 voice_transcript = None
 
-if HAS_AUDIOREC:
-    st.subheader("Record directly")
-    raw = audio_recorder(
-        text="Click to record / stop",
-        recording_color="#ef4444",
-        neutral_color="#e5e7eb",
-        icon_size="2x",
-        key="voice_recorder_a",
+st.divider()
+
+# The free-text answers and the submit button share one form, so typing
+# doesn't rerun the script; the voice recorder above stays live.
+with st.form("feedback_form", border=False):
+    st.subheader("Brief description")
+    open_feedback_text = st.text_area(
+        "Can you briefly describe your experience?",
+        placeholder="Examples:\n• Sunlight is hitting my screen\n• It feels stuffy\n• Too bright near the window",
+        height=120,
+        key="fb_open_feedback_text",
     )
 
-    if raw is not None:
-        audio_bytes = raw
-        st.success(f"Recorded successfully: {len(audio_bytes)} bytes")
-        st.audio(io.BytesIO(audio_bytes), format=audio_mime)
-
-st.subheader("Or upload an audio file")
-upload = st.file_uploader("Upload voice note (wav/mp3/m4a)", type=["wav", "mp3", "m4a"])
+    feedback_influence = st.radio(
+        "Did others’ feedback influence your response?",
+        FEEDBACK_INFLUENCE_OPTIONS,
+        horizontal=True,
+        key="fb_feedback_influence",
+    )
 
-if upload is not None:
-    audio_bytes = upload.read()
-    audio_mime = upload.type or "audio/wav"
-    st.success(f"Uploaded file: {len(audio_bytes)} bytes")
-    st.audio(io.BytesIO(audio_bytes), format=audio_mime)
+    voice_note_text = st.text_input(
+        "Short summary of your voice note (optional)",
+        placeholder="e.g., glare on screen, too warm near the window",
+        key="fb_voice_note_text",
+    )
 
+    submitted = st.form_submit_button("Submit Feedback", type="primary")
 
-# ---------- Submit / Reset ----------
-left, right = st.columns([1, 2])
-
-with left:
-    if st.button("Reset form"):
-        st.rerun()
-
-with right:
-    if st.button("Submit Feedback", type="primary"):
-        payload = {
-    "id": str(uuid.uuid4()),
-    "timestamp": datetime.now(timezone.utc).isoformat(),
-    "room": room.strip() or None,
-    "user_id": user_id.strip() or None,
-    "grid_number": int(grid_number),
-    "participant_type": participant_type,
-
-    "thermal_sensation": thermal_sensation,
-    "thermal_sensation_label": thermal_sensation_labels[thermal_sensation],
-    "thermal_comfort": thermal_comfort,
-    "thermal_preference": thermal_preference,
-
-    "brightness": brightness,
-    "glare_level": glare_level,
-    "visual_comfort": visual_comfort,
-    "visual_discomfort_flag": visual_discomfort_flag,
-
-    "task_interference": task_interference == "Yes",
-    "task_interference_note": task_interference_note.strip() if task_interference_note else None,
-    "concentration": concentration,
-    "productivity": productivity,
-
-    "time_in_space": time_in_space,
-
-    "open_feedback_text": open_feedback_text.strip() or None,
-    "feedback_influence": feedback_influence,
-    "voice_note_text": voice_note_text.strip() or None,
-}
-        # audio upload
-        audio_path = None
+def submit_feedback(payload: dict) -> bool:
+    upload_error = None
+    with st.status("Submitting your feedback…") as status:
+        # audio columns are only sent when there is a clip, otherwise the
+        # table defaults apply
         if audio_bytes:
+            # content-addressed: the same clip always maps to the same object
+            digest = hashlib.blake2b(audio_bytes, digest_size=12).hexdigest()
+            fname = f"voice/{digest}{audio_ext}"
+            audio_meta = {
+                "audio_path": fname,
+                "audio_mime": audio_mime,
+                "audio_seconds": wav_seconds(audio_bytes) if audio_mime == "audio/wav" else None,
+                "voice_transcript": voice_transcript or None,
+            }
+            # merged in one update; unset optional fields keep the table defaults
+            payload.update({k: v for k, v in audio_meta.items() if v is not None})
+            st.write("Uploading voice note…")
             try:
-                fname = f"voice/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex}.wav"
-
-                supabase.storage.from_(SUPABASE_BUCKET).upload(
-                    path=fname,
-                    file=audio_bytes,
-                    file_options={"content-type": audio_mime, "x-upsert": "true"},
-                )
-                audio_path = fname
+                store_clip(get_bucket(), payload, audio_bytes, audio_mime, _optional_deps()["AudioSegment"])
             except Exception as e:
-                st.error(f"⚠️ Audio upload failed: {e}")
-
-        payload.update(
-            {
-                "audio_path": audio_path,
-                "audio_mime": audio_mime if audio_path else None,
-                "audio_seconds": audio_seconds,
-                "voice_transcript": voice_transcript,
-                "voice_note_text": voice_note_text.strip() or None,
-            }
-        )
+                # the answers are still saved, without the clip
+                upload_error = e
+                for col in AUDIO_COLUMNS:
+                    payload.pop(col, None)
 
+        # The row is written before anything is confirmed to the participant
+        st.write("Saving your answers…")
         try:
-            supabase.table(TABLE).insert(payload).execute()
-            st.success("✅ Thanks! Your feedback was submitted.")
-            st.rerun()
+            get_table().insert(payload, returning="minimal").execute()
         except Exception as e:
+            status.update(label="Submission failed", state="error")
             st.error(f"❌ Failed to submit: {e}")
+            return False
+        status.update(label="Feedback saved", state="complete")
+
+    if upload_error is not None:
+        st.warning(f"⚠️ Audio upload failed: {upload_error}. Your answers were saved without the voice note.")
+    else:
+        st.success("✅ Thanks! Your feedback was submitted.")
+    return True
+
+# ---------- Submit / Reset ----------
+# Runs as a callback before the button's own rerun, so there's no second
+# top-to-bottom pass. Every survey widget has an fb_* key, so dropping those
+# (plus the survey's own published state) puts the survey back to its
+# defaults. Session state is shared by all pages, so nothing else is touched:
+# the probe flag, the Sensors queue and the Playback page survive the reset.
+SURVEY_STATE_KEYS = ("ratings", "voice_note", "voice_recorder_a", "_last_submit_hash")
+
+def reset_form() -> None:
+    for key in list(st.session_state):
+        if key.startswith("fb_") or key in SURVEY_STATE_KEYS:
+            del st.session_state[key]
+
+st.button("Reset form", on_click=reset_form)
+
+if submitted:
+    now = datetime.now(timezone.utc)
+    payload = {
+        "id": str(uuid.uuid4()),
+        "timestamp": now.isoformat(),
+        "room": room.strip() or None,
+        "user_id": user_id.strip() or None,
+        "grid_number": int(grid_number),
+        "participant_type": participant_type,
+
+        "thermal_sensation": thermal_sensation,
+        "thermal_sensation_label": THERMAL_LABELS[thermal_sensation],
+        "thermal_comfort": thermal_comfort,
+        "thermal_preference": thermal_preference,
+
+        "brightness": brightness,
+        "glare_level": glare_level,
+        "visual_comfort": visual_comfort,
+        "visual_discomfort_flag": visual_discomfort_flag,
+
+        "task_interference": task_interference == "Yes",
+        "task_interference_note": task_interference_note.strip() if task_interference_note else None,
+        "concentration": concentration,
+        "productivity": productivity,
+
+        "time_in_space": time_in_space,
+
+        "open_feedback_text": open_feedback_text.strip() or None,
+        "feedback_influence": feedback_influence,
+        "voice_note_text": voice_note_text.strip() or None,
+    }
+
+    # a double-click re-sends the same answers: skip the network calls
+    submit_hash = submission_hash(payload, audio_bytes)
+    if st.session_state.get("_last_submit_hash") == submit_hash:
+        st.info("This response was already submitted.")
+    elif submit_feedback(payload):
+        st.session_state["_last_submit_hash"] = submit_hash
 
-voice_note_text = st.text_input(
-    "Short summary of your voice note (optional)",
-    placeholder="e.g., glare on screen, too warm near the window"
-)
 # ---------------------------- LLM ----------------------------
 
-st.markdown("---")
+st.divider()
 st.header("🤖 Smart Feedback")
 st.caption("Generate short AI-assisted suggestions based on your current responses.")
 
@@ -456,7 +608,7 @@ def build_rule_feedback() -> list[str]:
         feedback.append("Your thermal comfort is low. Adjusting temperature or air movement may improve comfort.")
 
     # Visual
-    if glare_level in ["Moderate", "Severe"]:
+    if glare_level in GLARE_DISCOMFORT:
         feedback.append("Glare is affecting your comfort. Consider adjusting blinds, seating angle, or screen position.")
 
     if brightness == "Too dim":
@@ -480,7 +632,23 @@ def build_rule_feedback() -> list[str]:
     return feedback
 
 
+# openai is only imported (and the client built) the first time someone asks
+# for AI feedback, not at app start-up
+@st.cache_resource(show_spinner=False)
+def get_openai():
+    api_key = st.secrets.get("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key)
+
+
+# Identical answers give an identical prompt: reuse the earlier suggestions
+# instead of paying for another model round-trip
+@st.cache_data(show_spinner=False, max_entries=64)
 def generate_llm_feedback(context_text: str) -> str:
+    client = get_openai()
     if client is None:
         raise RuntimeError("OPENAI_API_KEY is not set.")
 
@@ -510,7 +678,7 @@ Participant type: {participant_type}
 Seat/grid number: {grid_number}
 Time in space: {time_in_space}
 
-Thermal sensation: {thermal_sensation_labels[thermal_sensation]} ({thermal_sensation})
+Thermal sensation: {THERMAL_LABELS[thermal_sensation]} ({thermal_sensation})
 Thermal comfort: {thermal_comfort}
 Thermal preference: {thermal_preference}
 
@@ -1,83 +1,185 @@
 # -------------------- 01_Dashboard.py (clean) --------------------
-import socket
-from urllib.parse import urlparse
+import threading
 
+import numpy as np
 import pandas as pd
 import streamlit as st
-from supabase import Client, create_client
+from supabase_helpers import get_supabase, probe_supabase, select_columns
 
 # 1) Page config — must be FIRST Streamlit call
 st.set_page_config(page_title="Comfort Dashboard", page_icon="📊", layout="wide")
 
 # 2) Secrets → vars (strip/normalize)
 SUPABASE_URL  = st.secrets["SUPABASE_URL"].strip().rstrip("/")
-SUPABASE_KEY  = st.secrets["SUPABASE_KEY"].strip()
 FEEDBACK_TABLE = st.secrets.get("SUPABASE_TABLE", "feedback")
 
-# 3) One Supabase client (cached)
-@st.cache_resource
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
+# 3) One Supabase client, shared with the other pages
 supabase = get_supabase()
 
-# 4) Connectivity probe
-host = urlparse(SUPABASE_URL).hostname or ""
-try:
-    _ip = socket.gethostbyname(host)
-    supabase.table(FEEDBACK_TABLE).select("id").limit(1).execute()
-    #st.caption(f"✅ Supabase connected ({host} → {_ip})")
-except Exception as e:
-    st.error(f"❌ Supabase probe failed: {e}")
+# 4) Connectivity probe (shared, cached 5 min per table).
+# A failure is remembered for the session so reruns show it without re-probing.
+probe_err_key = f"_probe_err_{FEEDBACK_TABLE}"
+if probe_err_key not in st.session_state:
+    try:
+        probe_supabase(supabase, SUPABASE_URL, FEEDBACK_TABLE)
+        st.session_state[probe_err_key] = None
+    except Exception as e:
+        st.session_state[probe_err_key] = str(e)
+if st.session_state[probe_err_key]:
+    st.error(f"❌ Supabase probe failed: {st.session_state[probe_err_key]}")
 
 st.title("📊 Comfort Dashboard")
 
 # -------- Data fetch --------
-@st.cache_data(ttl=60)
-def fetch_feedback(limit: int = 2000) -> pd.DataFrame:
-    res = (
-        supabase.table(FEEDBACK_TABLE)
-        .select("*")
-        .order("timestamp", desc=True)
-        .limit(limit)
-        .execute()
-    )
-    df = pd.DataFrame(res.data or [])
+# Only the columns the KPIs, charts and table use; the long free-text fields
+# are never read here. The schema has changed over time, so the list is
+# intersected once per hour with the columns of a sample row ("*" until the
+# table has any rows).
+DASHBOARD_COLUMNS = (
+    "id", "timestamp", "ts", "room", "participant_type", "grid_number", "clothing",
+    "thermal_sensation", "thermal_comfort", "brightness", "glare_level", "glare_rating",
+    "visual_comfort", "concentration", "productivity", "time_in_space",
+)
+
+CATEGORY_COLUMNS = (
+    "room", "clothing", "participant_type", "thermal_comfort", "brightness",
+    "glare_level", "visual_comfort", "time_in_space",
+)
+
+def dashboard_select() -> str:
+    return select_columns(supabase, FEEDBACK_TABLE, DASHBOARD_COLUMNS)
+
+MAX_DAYS = 30
+FEED_LIMIT = 2000
+
+def _to_frame(rows, columns: str) -> pd.DataFrame:
+    # Known column list: no per-row key inference
+    df = pd.DataFrame.from_records(rows or [], columns=None if columns == "*" else columns.split(","))
     if df.empty:
         return df
-
     time_col = "timestamp" if "timestamp" in df.columns else ("ts" if "ts" in df.columns else None)
     if time_col:
-        df[time_col] = pd.to_datetime(df[time_col], errors="coerce", utc=True)
+        df[time_col] = pd.to_datetime(df[time_col], format="ISO8601", errors="coerce", utc=True, cache=True)
+        # rows arrive newest-first from .order(desc=True); no re-sort needed
         df = df.dropna(subset=[time_col]).rename(columns={time_col: "timestamp"})
-        df = df.sort_values("timestamp")
+    if "thermal_sensation" in df.columns:
+        df["thermal_sensation"] = pd.to_numeric(df["thermal_sensation"], errors="coerce").astype("Int8")
     return df
 
-df = fetch_feedback()
-if df.empty:
-    st.info("No feedback yet. Submit some entries on the main page.")
-    st.stop()
+# One process-wide frame covering the widest window (MAX_DAYS). The first sync
+# loads it; after that each cache expiry only asks PostgREST for rows from a
+# few minutes before the newest one held and merges them in (deduplicated on
+# id), so steady-state refreshes carry just the delta. The overlap picks up
+# rows stored after a newer one (timestamps are set client-side at submit);
+# "Refresh data" drops the frame for anything later than that.
+DELTA_OVERLAP = pd.Timedelta(minutes=5)
+
+@st.cache_resource(show_spinner=False)
+def _feedback_store() -> dict:
+    return {"df": None, "lock": threading.Lock()}
+
+def reset_feedback_store() -> None:
+    store = _feedback_store()
+    with store["lock"]:
+        store["df"] = None
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def feedback_snapshot() -> pd.DataFrame:
+    store = _feedback_store()
+    with store["lock"]:
+        columns = dashboard_select()
+        held = store["df"]
+        q = supabase.table(FEEDBACK_TABLE).select(columns).order("timestamp", desc=True).limit(FEED_LIMIT)
+        if held is not None and not held.empty and "timestamp" in held.columns:
+            since = held["timestamp"].iloc[0] - DELTA_OVERLAP
+        else:
+            held = None
+            since = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=MAX_DAYS)
+        new = _to_frame(q.gte("timestamp", since.isoformat()).execute().data, columns)
+        if held is not None and not new.empty:
+            new = pd.concat([new, held], ignore_index=True)
+            if "id" in new.columns:
+                new = new.drop_duplicates("id", keep="first")
+            # late rows can land behind held ones; restore newest-first
+            new = new.sort_values("timestamp", ascending=False, kind="stable").head(FEED_LIMIT)
+        elif held is not None:
+            new = held
+        store["df"] = new
+        return new
+
+# The snapshot is held by reference (no pickle round-trip per rerun): the page
+# only ever derives new frames from it and must never mutate it in place.
+@st.cache_resource(ttl=60, show_spinner=False)
+def fetch_feedback(days_back: int) -> pd.DataFrame:
+    df = feedback_snapshot()
+    if df.empty:
+        return df
+    cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=days_back)
+    # Newest-first, so the window is a prefix: a binary search on the
+    # reversed datetime64 array finds its length without a boolean mask.
+    ts = df["timestamp"].values
+    df = df.iloc[: len(ts) - np.searchsorted(ts[::-1], cutoff.to_datetime64(), side="left")]
+    # Low-cardinality text columns become categoricals: smaller, faster
+    # value_counts, cheap equality checks, and the sorted room/clothing
+    # categories double as the selectbox options.
+    cats = {col: "category" for col in CATEGORY_COLUMNS if col in df.columns}
+    return df.astype(cats) if cats else df.copy()
 
 # -------- Filters --------
 c1, c2, c3 = st.columns(3)
 with c1:
-    days_back = st.slider("Days back", 1, 30, 7)
+    days_back = st.slider("Days back", 1, MAX_DAYS, 7)
+
+df = fetch_feedback(days_back)
+if df.empty:
+    st.info("No feedback in this time window. Submit some entries on the main page.")
+    st.stop()
+
 with c2:
-    room_opt = ["(all)"] + sorted(df["room"].dropna().unique()) if "room" in df else ["(all)"]
+    room_opt = ["(all)"] + list(df["room"].cat.categories) if "room" in df else ["(all)"]
     room_sel = st.selectbox("Room", room_opt)
 with c3:
-    clothing_opt = ["(all)"] + sorted(df["clothing"].dropna().unique()) if "clothing" in df else ["(all)"]
+    clothing_opt = ["(all)"] + list(df["clothing"].cat.categories) if "clothing" in df else ["(all)"]
     clothing_sel = st.selectbox("Clothing", clothing_opt)
 
-cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=days_back)
-
-mask = df["timestamp"] >= cutoff
-if room_sel != "(all)" and "room" in df:
-    mask &= df["room"] == room_sel
-if clothing_sel != "(all)" and "clothing" in df:
-    mask &= df["clothing"] == clothing_sel
-
-view = df.loc[mask].copy()
+# Room/clothing options come from the window itself, so those two filters
+# stay local: cheap categorical compares on an already-small frame, ANDed
+# into one mask so the frame is sliced once. The filtered view and every
+# KPI/chart aggregate are cached per filter combination, so widgets that
+# don't change the filters (e.g. "Rows to show") skip all of it.
+# Group on the floored hour (no DatetimeIndex / resample machinery), then
+# reindex once so the line chart still gets a continuous hourly axis.
+def hourly_counts(ts: pd.Series) -> pd.Series:
+    if ts.empty:
+        return pd.Series(dtype="int64")
+    counts = ts.groupby(ts.dt.floor("h"), sort=True).size()
+    hours = pd.date_range(counts.index[0], counts.index[-1], freq="h")
+    return counts.reindex(hours, fill_value=0)
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def dashboard_view(days_back: int, room_sel: str, clothing_sel: str):
+    df = fetch_feedback(days_back)
+    conds = []
+    if room_sel != "(all)" and "room" in df:
+        conds.append(df["room"].eq(room_sel).to_numpy())
+    if clothing_sel != "(all)" and "clothing" in df:
+        conds.append(df["clothing"].eq(clothing_sel).to_numpy())
+    view = df[np.logical_and.reduce(conds)] if conds else df
+
+    thermal = view["thermal_sensation"] if "thermal_sensation" in view else None
+    aggs = {
+        "rooms": view["room"].nunique() if "room" in view else 0,
+        "avg_thermal": thermal.dropna().mean() if thermal is not None else float("nan"),
+        "glare_high": int((view["glare_rating"] >= 4).sum()) if "glare_rating" in view else 0,
+        "thermal_counts": thermal.value_counts().sort_index() if thermal is not None else None,
+        # categoricals count every category; keep only the observed ones
+        "brightness_counts": view["brightness"].value_counts()[lambda c: c > 0] if "brightness" in view else None,
+        "clothing_counts": view["clothing"].value_counts()[lambda c: c > 0] if "clothing" in view else None,
+        "hourly": hourly_counts(view["timestamp"]),
+    }
+    return view, aggs
+
+view, aggs = dashboard_view(days_back, room_sel, clothing_sel)
 if view.empty:
     st.warning("No rows match the current filters.")
     st.stop()
@@ -85,39 +187,40 @@ if view.empty:
 # -------- KPIs --------
 k1, k2, k3, k4 = st.columns(4)
 k1.metric("Submissions", len(view))
-k2.metric("Rooms", view["room"].nunique() if "room" in view else 0)
-k3.metric(
-    "Avg thermal sensation",
-    f'{view.get("thermal_sensation", pd.Series(dtype=float)).dropna().mean():.2f}'
-)
-k4.metric("Glare ≥ 4", int((view.get("glare_rating", pd.Series(dtype=float)) >= 4).sum()))
+k2.metric("Rooms", aggs["rooms"])
+k3.metric("Avg thermal sensation", f'{aggs["avg_thermal"]:.2f}')
+k4.metric("Glare ≥ 4", aggs["glare_high"])
 
-st.markdown("---")
+st.divider()
 
 # -------- Charts --------
-if "thermal_sensation" in view:
+if aggs["thermal_counts"] is not None:
     st.subheader("Thermal sensation (counts)")
-    st.bar_chart(view["thermal_sensation"].value_counts().sort_index())
+    st.bar_chart(aggs["thermal_counts"])
 
 colA, colB = st.columns(2)
 with colA:
-    if "brightness" in view:
+    if aggs["brightness_counts"] is not None:
         st.subheader("Brightness")
-        st.bar_chart(view["brightness"].value_counts())
+        st.bar_chart(aggs["brightness_counts"])
 with colB:
-    if "clothing" in view:
+    if aggs["clothing_counts"] is not None:
         st.subheader("Clothing")
-        st.bar_chart(view["clothing"].value_counts())
+        st.bar_chart(aggs["clothing_counts"])
 
 st.subheader("Submissions over time (hourly)")
-ts = view.set_index("timestamp").resample("1H").size()
-st.line_chart(ts)
+st.line_chart(aggs["hourly"])
 
 st.subheader("Latest rows")
 n = st.slider("Rows to show", 50, 1000, 200, step=50)
-st.dataframe(view.sort_values("timestamp", ascending=False).head(n), use_container_width=True)
+st.dataframe(view.head(n), use_container_width=True)
 
 if st.button("🔄 Refresh data"):
+    # a full reload, not another delta: rows the overlap missed come back
+    reset_feedback_store()
+    feedback_snapshot.clear()
+    fetch_feedback.clear()
+    dashboard_view.clear()
     st.cache_data.clear()
     st.rerun()
 # ------------------ end file ------------------
@@ -1,11 +1,12 @@
 # -------------------- pages/02_Sensors.py --------------------
-import socket
-from urllib.parse import urlparse
-from datetime import datetime, timezone
+import io
+from datetime import datetime, timedelta, timezone
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import streamlit as st
-from supabase import Client, create_client
+from supabase_helpers import get_supabase, probe_supabase
 
 try:
     from postgrest import APIError
@@ -20,152 +21,349 @@ st.title("📟 Sensor Readings")
 
 # 2) Secrets
 SUPABASE_URL = st.secrets["SUPABASE_URL"].strip().rstrip("/")
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"].strip()
 SENSORS_TABLE = st.secrets.get("SENSORS_TABLE", "sensor_readings")
+INSERT_BATCH = int(st.secrets.get("INSERT_BATCH", 100))
 
-# 3) Supabase client
-@st.cache_resource
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
+# 3) One Supabase client, shared with the other pages
 supabase = get_supabase()
 
-# 4) Connectivity probe
-host = urlparse(SUPABASE_URL).hostname or ""
-try:
-    _ip = socket.gethostbyname(host)
-    supabase.table(SENSORS_TABLE).select("device_id").limit(1).execute()
-except Exception as e:
-    st.error(f"❌ Supabase probe failed: {e}")
+# 4) Connectivity probe (shared, cached 5 min per table).
+# A failure is remembered for the session so reruns show it without re-probing.
+probe_err_key = f"_probe_err_{SENSORS_TABLE}"
+if probe_err_key not in st.session_state:
+    try:
+        probe_supabase(supabase, SUPABASE_URL, SENSORS_TABLE, "device_id")
+        st.session_state[probe_err_key] = None
+    except Exception as e:
+        st.session_state[probe_err_key] = str(e)
+if st.session_state[probe_err_key]:
+    st.error(f"❌ Supabase probe failed: {st.session_state[probe_err_key]}")
 
 # 5) Fetch data
-@st.cache_data(ttl=60)
-def fetch_sensors(limit: int = 5000) -> pd.DataFrame:
-    try:
-        res = (
-            supabase.table(SENSORS_TABLE)
-            .select("*")
-            .order("timestamp", desc=True)
-            .limit(limit)
-            .execute()
-        )
-        data = res.data or []
-    except APIError as e:
+SENSOR_FIELDS = ("timestamp", "device_id", "room", "temp_c", "rh_percent", "co2_ppm", "lux")
+SENSOR_COLUMNS = ",".join(SENSOR_FIELDS)
+NUMERIC_FIELDS = ("temp_c", "rh_percent", "co2_ppm", "lux")
+# float32 halves the cached frame; sensor precision is far below 7 digits.
+# Kept float (not unsigned int) so missing readings stay NaN.
+CSV_CONVERT = pacsv.ConvertOptions(
+    column_types={
+        "timestamp": pa.string(),
+        "device_id": pa.dictionary(pa.int32(), pa.string()),
+        "room": pa.dictionary(pa.int32(), pa.string()),
+        **{c: pa.float32() for c in NUMERIC_FIELDS},
+    },
+    include_columns=list(SENSOR_FIELDS),
+    include_missing_columns=True,
+    # PostgREST writes NULL as an empty field; read it back as missing, not ""
+    strings_can_be_null=True,
+)
+
+
+def _report_api_error(e: Exception) -> None:
+    if isinstance(e, APIError):
         st.error(
             f"Supabase error → code={getattr(e, 'code', None)} | "
             f"message={getattr(e, 'message', e)} | details={getattr(e, 'details', None)}"
         )
+    else:
+        st.error(f"Unexpected fetch error: {e}")
+
+
+def _cutoff_iso(days_back: int) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_back)).isoformat()
+
+
+def _filter_window(q, days_back: int, device_id: str | None, room: str | None):
+    q = q.gte("timestamp", _cutoff_iso(days_back))
+    if device_id is not None:
+        q = q.eq("device_id", device_id)
+    if room is not None:
+        q = q.eq("room", room)
+    return q
+
+
+# Row count plus newest timestamp of the filtered window, in one request. The
+# count alone can stay flat while a steady sensor adds rows as old ones age
+# out; the newest timestamp moves with every new reading. A cheap cache key
+# for the raw fetch below.
+@st.cache_data(ttl=60, show_spinner=False)
+def sensor_fingerprint(
+    days_back: int, device_id: str | None, room: str | None
+) -> tuple[int | None, str | None]:
+    q = supabase.table(SENSORS_TABLE).select("timestamp", count="exact")
+    res = _filter_window(q, days_back, device_id, room).order("timestamp", desc=True).limit(1).execute()
+    return res.count, (res.data[0]["timestamp"] if res.data else None)
+
+
+# Persisted across restarts; errors raise so they are never written to disk.
+# (Streamlit ignores ttl for persisted caches — the fingerprint does that job.)
+@st.cache_data(persist="disk", max_entries=64, show_spinner=False)
+def _fetch_raw(
+    fingerprint: tuple[int | None, str | None],
+    days_back: int,
+    device_id: str | None,
+    room: str | None,
+    limit: int,
+) -> pd.DataFrame:
+    q = supabase.table(SENSORS_TABLE).select(SENSOR_COLUMNS)
+    # PostgREST renders CSV (Accept: text/csv) and Arrow's C reader parses it,
+    # so no per-row dicts are built in Python. device_id/room are read as
+    # dictionary columns, which to_pandas turns straight into categoricals.
+    res = (
+        _filter_window(q, days_back, device_id, room)
+        .order("timestamp", desc=True)
+        .limit(limit)
+        .csv()
+        .execute()
+    )
+
+    if not res.data:
+        return pd.DataFrame()
+
+    table = pacsv.read_csv(io.BytesIO(res.data.encode()), convert_options=CSV_CONVERT)
+    if table.num_rows == 0:
         return pd.DataFrame()
+
+    df = table.to_pandas()
+    # Postgres' CSV timestamptz text ("2025-01-01 12:00:00+00") is left to the
+    # ISO8601 parser, which accepts the short offset Arrow does not.
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", errors="coerce", utc=True, cache=True)
+    return df.dropna(subset=["timestamp"]).sort_values("timestamp")
+
+
+def fetch_sensors(
+    days_back: int,
+    device_id: str | None = None,
+    room: str | None = None,
+    limit: int = 5000,
+) -> pd.DataFrame:
+    try:
+        fingerprint = sensor_fingerprint(days_back, device_id, room)
+        return _fetch_raw(fingerprint, days_back, device_id, room, limit)
     except Exception as e:
-        st.error(f"Unexpected fetch error: {e}")
+        _report_api_error(e)
         return pd.DataFrame()
 
-    df = pd.DataFrame(data)
-    if df.empty:
-        return df
 
-    if "timestamp" not in df.columns:
-        st.warning("No 'timestamp' column found in sensor_readings.")
-        return df
+# Distinct devices/rooms in the window — only two columns come over the wire,
+# and like the raw fetch the result is keyed on the window's fingerprint.
+@st.cache_data(max_entries=64, show_spinner=False)
+def _fetch_options(fingerprint: tuple[int | None, str | None], days_back: int) -> tuple[list[str], list[str]]:
+    q = supabase.table(SENSORS_TABLE).select("device_id,room")
+    res = _filter_window(q, days_back, None, None).limit(5000).execute()
+    data = res.data or []
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True)
-    df = df.dropna(subset=["timestamp"]).sort_values("timestamp")
-    return df
+    devices = sorted({str(r["device_id"]) for r in data if r.get("device_id") is not None})
+    rooms = sorted({str(r["room"]) for r in data if r.get("room") is not None})
+    return devices, rooms
 
 
-df = fetch_sensors()
+def fetch_sensor_options(days_back: int) -> tuple[list[str], list[str]]:
+    try:
+        return _fetch_options(sensor_fingerprint(days_back, None, None), days_back)
+    except Exception as e:
+        _report_api_error(e)
+        return [], []
 
-# 6) Empty state
-if df.empty:
-    st.info("No sensor data yet. Use the insert tester below or your device to post readings.")
-else:
-    # 7) Filters
-    top1, top2, top3 = st.columns(3)
 
-    with top1:
-        days_back = st.slider("Days back", min_value=1, max_value=30, value=7)
+# Pandas resample rule → Postgres interval for the sensor_kpis RPC
+BIN_INTERVALS = {
+    "5min": "5 minutes",
+    "15min": "15 minutes",
+    "30min": "30 minutes",
+    "1H": "1 hour",
+    "1D": "1 day",
+}
+
+
+# KPIs + pre-binned series computed in Postgres (see sql/sensor_kpis.sql).
+# Returns None when the function is not deployed so the page can fall back.
+@st.cache_data(ttl=60)
+def fetch_sensor_kpis(
+    days_back: int,
+    device_id: str | None,
+    room: str | None,
+    bin_rule: str,
+) -> dict | None:
+    try:
+        res = supabase.rpc(
+            "sensor_kpis",
+            {
+                "p_cut": _cutoff_iso(days_back),
+                "p_dev": device_id,
+                "p_room": room,
+                "p_bucket": BIN_INTERVALS[bin_rule],
+            },
+        ).execute()
+    except Exception:
+        return None
+
+    data = res.data or {}
+    series = pd.DataFrame(data.get("series") or [])
+    if not series.empty:
+        series["bin"] = pd.to_datetime(series["bin"], format="ISO8601", errors="coerce", utc=True, cache=True)
+        series = series.set_index("bin")
+
+    return {
+        "rows": int(data.get("rows") or 0),
+        "devices": int(data.get("devices") or 0),
+        "avg_co2": data.get("avg_co2"),
+        "avg_lux": data.get("avg_lux"),
+        "series": series,
+    }
+
+
+CHART_SERIES = (
+    ("temp_c", "Temperature (°C)"),
+    ("rh_percent", "Relative Humidity (%)"),
+    ("co2_ppm", "CO₂ (ppm)"),
+    ("lux", "Illuminance (lux)"),
+)
+MAX_BINS = 100_000
+
+
+def resample_mean(view: pd.DataFrame, bin_rule: str) -> pd.DataFrame:
+    cols = [c for c, _ in CHART_SERIES if c in view.columns]
+    frame = view.set_index("timestamp")[cols]
+    step = pd.Timedelta(bin_rule)
+    if frame.empty or (frame.index[-1] - frame.index[0]) / step <= MAX_BINS:
+        return frame.resample(bin_rule).mean()
+
+    # A stray reading far from the rest (e.g. a device with a bad clock) would
+    # allocate millions of empty bins; resample each contiguous run on its own.
+    run_id = (frame.index.to_series().diff() > step * 1000).cumsum().to_numpy()
+    return pd.concat(g.resample(bin_rule).mean() for _, g in frame.groupby(run_id))
+
+
+EMPTY_KPIS = {"rows": 0, "devices": 0, "avg_co2": None, "avg_lux": None, "series": pd.DataFrame()}
+
+
+def kpis_from_rows(view: pd.DataFrame, bin_rule: str) -> dict:
+    if view.empty:
+        return EMPTY_KPIS
+
+    return {
+        "rows": int(len(view)),
+        "devices": int(view["device_id"].nunique()) if "device_id" in view.columns else 0,
+        "avg_co2": view["co2_ppm"].mean() if "co2_ppm" in view.columns else None,
+        "avg_lux": view["lux"].mean() if "lux" in view.columns else None,
+        "series": resample_mean(view, bin_rule),
+    }
+
+
+# Fallback KPIs, memoized on the same cheap key as the raw fetch (the frame
+# itself is never hashed), so widget reruns skip the resample.
+@st.cache_data(max_entries=64, show_spinner=False)
+def _fallback_kpis(
+    fingerprint: tuple[int | None, str | None],
+    days_back: int,
+    device_id: str | None,
+    room: str | None,
+    bin_rule: str,
+) -> dict:
+    return kpis_from_rows(_fetch_raw(fingerprint, days_back, device_id, room, 5000), bin_rule)
+
+
+def fallback_kpis(days_back: int, device_id: str | None, room: str | None, bin_rule: str) -> dict:
+    try:
+        fingerprint = sensor_fingerprint(days_back, device_id, room)
+        return _fallback_kpis(fingerprint, days_back, device_id, room, bin_rule)
+    except Exception as e:
+        _report_api_error(e)
+        return EMPTY_KPIS
+
+
+# 6) Filters (read first so the query and its cache key depend on them)
+top1, top2, top3, top4 = st.columns(4)
+
+with top1:
+    days_back = st.slider("Days back", min_value=1, max_value=30, value=7)
 
-    with top2:
-        dev_series = df["device_id"].astype(str) if "device_id" in df.columns else pd.Series(dtype=str)
-        dev_opt = ["(all)"] + sorted(dev_series.dropna().unique().tolist())
-        dev_sel = st.selectbox("Device", dev_opt)
+dev_list, room_list = fetch_sensor_options(days_back)
 
-    with top3:
-        room_series = df["room"].astype(str) if "room" in df.columns else pd.Series(dtype=str)
-        room_opt = ["(all)"] + sorted(room_series.dropna().unique().tolist())
-        room_sel = st.selectbox("Room", room_opt)
+with top2:
+    dev_sel = st.selectbox("Device", ["(all)"] + dev_list)
 
-    cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=days_back)
-    mask = df["timestamp"] >= cutoff
+with top3:
+    room_sel = st.selectbox("Room", ["(all)"] + room_list)
 
-    if dev_sel != "(all)" and "device_id" in df.columns:
-        mask &= df["device_id"].astype(str) == dev_sel
+with top4:
+    bin_rule = st.selectbox("Time bin", list(BIN_INTERVALS), index=2)
 
-    if room_sel != "(all)" and "room" in df.columns:
-        mask &= df["room"].astype(str) == room_sel
+dev_arg = None if dev_sel == "(all)" else dev_sel
+room_arg = None if room_sel == "(all)" else room_sel
 
-    view = df.loc[mask].copy()
+view = None
+kpis = fetch_sensor_kpis(days_back, dev_arg, room_arg, bin_rule)
+if kpis is None:
+    view = fetch_sensors(days_back, dev_arg, room_arg)
+    kpis = fallback_kpis(days_back, dev_arg, room_arg, bin_rule)
 
+# 7) Empty state
+if kpis["rows"] == 0:
+    st.info("No sensor data yet. Use the insert tester below or your device to post readings.")
+else:
     # 8) KPIs
     k1, k2, k3, k4 = st.columns(4)
-    k1.metric("Rows", int(len(view)))
-    k2.metric("Devices", int(view["device_id"].nunique()) if "device_id" in view.columns else 0)
+    k1.metric("Rows", kpis["rows"])
+    k2.metric("Devices", kpis["devices"])
 
-    avg_co2 = view["co2_ppm"].dropna().mean() if "co2_ppm" in view.columns else None
-    avg_lux = view["lux"].dropna().mean() if "lux" in view.columns else None
+    avg_co2 = kpis["avg_co2"]
+    avg_lux = kpis["avg_lux"]
 
     k3.metric("Avg CO₂ (ppm)", f"{avg_co2:.0f}" if avg_co2 is not None and pd.notna(avg_co2) else "—")
     k4.metric("Avg Lux", f"{avg_lux:.0f}" if avg_lux is not None and pd.notna(avg_lux) else "—")
 
     # 9) Charts
-    if not view.empty:
-        bin_rule = st.selectbox("Time bin", ["5min", "15min", "30min", "1H", "1D"], index=2)
-        rs = view.set_index("timestamp").resample(bin_rule).mean(numeric_only=True)
-
-        if "temp_c" in rs.columns:
-            st.subheader("Temperature (°C)")
-            st.line_chart(rs["temp_c"])
-
-        if "rh_percent" in rs.columns:
-            st.subheader("Relative Humidity (%)")
-            st.line_chart(rs["rh_percent"])
-
-        if "co2_ppm" in rs.columns:
-            st.subheader("CO₂ (ppm)")
-            st.line_chart(rs["co2_ppm"])
-
-        if "lux" in rs.columns:
-            st.subheader("Illuminance (lux)")
-            st.line_chart(rs["lux"])
-
-    # 10) Latest rows
-    st.subheader("Latest rows")
-    st.dataframe(
-        view.sort_values("timestamp", ascending=False).head(200),
-        use_container_width=True,
-        height=380,
-    )
+    rs = kpis["series"]
+    for col, title in CHART_SERIES:
+        if col in rs.columns:
+            st.subheader(title)
+            st.line_chart(rs[col])
+
+    # 10) Latest rows — raw rows are only pulled when the aggregates came from the RPC
+    with st.expander("Latest rows"):
+        latest = view if view is not None else fetch_sensors(days_back, dev_arg, room_arg, limit=200)
+        # latest is already ascending by timestamp; a reversed slice avoids a re-sort.
+        # Handing st.dataframe an index-free Arrow table skips its own pandas→Arrow
+        # conversion and keeps the index out of the payload.
+        st.dataframe(
+            pa.Table.from_pandas(latest.iloc[::-1].head(200), preserve_index=False),
+            use_container_width=True,
+            height=400,
+        )
 
-# 11) Manual test insert
-with st.expander("Manual test insert (for debugging)"):
-    c1, c2, c3, c4, c5, c6 = st.columns(6)
-
-    with c1:
-        device_id = st.text_input("device_id", "esp32-classroom-01")
-    with c2:
-        room = st.text_input("room", "Lab-101")
-    with c3:
-        temp_c = st.number_input("temp_c", value=23.0)
-    with c4:
-        rh_percent = st.number_input("rh_percent", value=45.0)
-    with c5:
-        co2_ppm = st.number_input("co2_ppm", value=700.0)
-    with c6:
-        lux = st.number_input("lux", value=500.0)
-
-    if st.button("Insert test row"):
-        try:
-            payload = {
+# 11) Manual test insert — a fragment, so queueing/flushing reruns only this panel
+@st.fragment
+def manual_insert_panel() -> None:
+    with st.expander("Manual test insert (for debugging)"):
+        c1, c2, c3, c4, c5, c6 = st.columns(6)
+
+        with c1:
+            device_id = st.text_input("device_id", "esp32-classroom-01")
+        with c2:
+            room = st.text_input("room", "Lab-101")
+        with c3:
+            temp_c = st.number_input("temp_c", value=23.0)
+        with c4:
+            rh_percent = st.number_input("rh_percent", value=45.0)
+        with c5:
+            co2_ppm = st.number_input("co2_ppm", value=700.0)
+        with c6:
+            lux = st.number_input("lux", value=500.0)
+
+        pending_rows = st.session_state.setdefault("pending_rows", [])
+
+        # Fixed labels and keys: a label that changes with the count would give
+        # the button a new widget id each rerun and drop the next click
+        b1, b2 = st.columns(2)
+        with b1:
+            queue_clicked = st.button("Insert test row", key="queue_row")
+        with b2:
+            flush_clicked = st.button("Flush buffered rows", key="flush_rows")
+
+        if queue_clicked:
+            pending_rows.append({
                 "timestamp": datetime.now(timezone.utc).isoformat(),
                 "device_id": device_id,
                 "room": room,
@@ -174,19 +372,33 @@ with st.expander("Manual test insert (for debugging)"):
                 "co2_ppm": float(co2_ppm),
                 "lux": float(lux),
                 "sensor_type": "manual_test",
-            }
-
-            supabase.table(SENSORS_TABLE).insert(payload).execute()
-            st.success("Row inserted ✅")
-            st.cache_data.clear()
-            st.rerun()
-
-        except APIError as e:
-            st.error(
-                f"Insert failed → code={getattr(e, 'code', None)} | "
-                f"message={getattr(e, 'message', e)} | details={getattr(e, 'details', None)}"
-            )
-        except Exception as e:
-            st.error(f"Insert failed: {e}")
+            })
+
+        # One insert([...]) call per batch instead of one round-trip per row;
+        # return=minimal, since the inserted rows are never read back
+        if pending_rows and (flush_clicked or len(pending_rows) >= INSERT_BATCH):
+            try:
+                supabase.table(SENSORS_TABLE).insert(pending_rows, returning="minimal").execute()
+                st.toast(f"{len(pending_rows)} row(s) inserted", icon="✅")
+                pending_rows.clear()
+                # New rows change the fingerprint, so the raw/options caches
+                # re-key themselves; only the TTL-cached queries need clearing.
+                sensor_fingerprint.clear()
+                fetch_sensor_kpis.clear()
+
+            except APIError as e:
+                st.error(
+                    f"Insert failed → code={getattr(e, 'code', None)} | "
+                    f"message={getattr(e, 'message', e)} | details={getattr(e, 'details', None)}"
+                )
+            except Exception as e:
+                st.error(f"Insert failed: {e}")
+
+        # Counted after this run's queue/flush, so it is never one behind
+        if pending_rows:
+            st.caption(f"Queued {len(pending_rows)}/{INSERT_BATCH} rows — flush to write them now.")
+
+
+manual_insert_panel()
 
 # -------------------- end file --------------------
@@ -1,10 +1,13 @@
 # -------------------- pages/04_Voice_Playback.py (clean) --------------------
-import socket
-from urllib.parse import urlparse
-from datetime import datetime
+import base64
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import quote
 
 import streamlit as st
-from supabase import Client, create_client
+from supabase_helpers import get_supabase, probe_supabase, select_columns
 
 # 1) Page config — must be FIRST Streamlit call
 st.set_page_config(page_title="Voice Playback", page_icon="🎧", layout="wide")
@@ -12,83 +15,151 @@ st.title("🎧 Playback")
 
 # 2) Secrets → vars
 SUPABASE_URL  = st.secrets["SUPABASE_URL"].strip().rstrip("/")
-SUPABASE_KEY  = st.secrets["SUPABASE_KEY"].strip()
 BUCKET        = st.secrets.get("SUPABASE_BUCKET", "voice-recordings")
 TABLE         = st.secrets.get("SUPABASE_TABLE", "feedback")
 SIGNED_SECONDS = int(st.secrets.get("SIGNED_SECONDS", 3600))
+JWT_SECRET    = st.secrets.get("SUPABASE_JWT_SECRET")
 
-# 3) One Supabase client (cached)
-@st.cache_resource
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
+# 3) One Supabase client, shared with the other pages
 supabase = get_supabase()
 
-# 4) Connectivity probe
-host = urlparse(SUPABASE_URL).hostname or ""
-try:
-    _ip = socket.gethostbyname(host)
-    supabase.table(TABLE).select("id").limit(1).execute()
-    #st.caption(f"✅ Supabase connected ({host} → {_ip})")
-except Exception as e:
-    st.error(f"❌ Supabase probe failed: {e}")
+# 4) Connectivity probe (shared, cached 5 min per table).
+# A failure is remembered for the session so reruns show it without re-probing.
+probe_err_key = f"_probe_err_{TABLE}"
+if probe_err_key not in st.session_state:
+    try:
+        probe_supabase(supabase, SUPABASE_URL, TABLE)
+        st.session_state[probe_err_key] = None
+    except Exception as e:
+        st.session_state[probe_err_key] = str(e)
+if st.session_state[probe_err_key]:
+    st.error(f"❌ Supabase probe failed: {st.session_state[probe_err_key]}")
 
 # ---------- Filters ----------
-c1, c2 = st.columns(2)
-room_filter = c1.text_input("Filter by room (optional)")
+PAGE_SIZE = 25
+
+def _turn_page(step: int) -> None:
+    st.session_state["playback_page"] = max(1, st.session_state.get("playback_page", 1) + step)
+
+# A changed filter can leave the current page out of range: start over
+def _reset_page() -> None:
+    st.session_state["playback_page"] = 1
+    st.session_state["playback_open"] = None
+
+c1, c2, c3 = st.columns(3)
+room_filter = c1.text_input("Filter by room (optional)", on_change=_reset_page)
 type_filter = c2.selectbox(
     "Filter by type",
     ["(all)", "thermal", "visual", "acoustic", "IAQ", "other"],
     index=0,
+    on_change=_reset_page,
 )
+page = c3.number_input("Page", min_value=1, step=1, key="playback_page")
 
 # ---------- Query rows with audio ----------
-# --- Query rows (simple, then filter in Python) ---
+# Only the columns the list reads (no survey answers or long free text);
+# feedback_type/feedback_text only exist on older tables.
+PLAYBACK_COLUMNS = (
+    "id", "timestamp", "room", "feedback_type", "feedback_text", "voice_transcript", "audio_path",
+)
+
+# One page of rows with a recording, narrowed by the filters in PostgREST;
+# cached per (filters, page), so reruns that don't touch them make no DB call.
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_rows(room: str, ftype: str, page: int) -> tuple[list[dict], int | None]:
+    columns = select_columns(supabase, TABLE, PLAYBACK_COLUMNS)
+    # count="planned": the planner's row estimate for the total, not a full
+    # count(*) scan of the table on every page
+    q = supabase.table(TABLE).select(columns, count="planned").not_.is_("audio_path", "null")
+    if room:
+        q = q.ilike("room", f"%{room}%")
+    if ftype != "(all)" and "feedback_type" in columns.split(","):
+        q = q.eq("feedback_type", ftype)
+    start = (page - 1) * PAGE_SIZE
+    res = q.order("timestamp", desc=True).range(start, start + PAGE_SIZE - 1).execute()
+    return res.data or [], res.count
+
 try:
-    res = (
-        supabase.table(TABLE)
-        .select("*")
-        .order("timestamp", desc=True)
-        .limit(1000)  # keep it reasonable
-        .execute()
-    )
-    rows = res.data or []
+    rows, approx_total = fetch_rows(room_filter.strip(), type_filter, int(page))
 except Exception as e:
     st.error(f"Query failed: {e}")
-    rows = []
+    rows, approx_total = [], None
+
+if approx_total:
+    st.caption(f"About {approx_total} recordings · page {page} of ~{-(-approx_total // PAGE_SIZE)}")
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+_JWT_HEADER = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+
+# Storage signed URLs are HS256 JWTs over {"url": "<bucket>/<path>"}; with the
+# project's JWT secret they can be minted in-process, with no Storage call.
+def sign_locally(paths: tuple) -> dict:
+    now = int(time.time())
+    key = JWT_SECRET.encode()
+    out = {}
+    for path in paths:
+        claims = {"url": f"{BUCKET}/{path}", "iat": now, "exp": now + SIGNED_SECONDS}
+        body = f"{_JWT_HEADER}.{_b64url(json.dumps(claims, separators=(',', ':')).encode())}"
+        sig = _b64url(hmac.new(key, body.encode(), hashlib.sha256).digest())
+        out[path] = f"{SUPABASE_URL}/storage/v1/object/sign/{BUCKET}/{quote(path)}?token={body}.{sig}"
+    return out
+
+# Signed URLs in one Storage request per path set (or none at all when
+# SUPABASE_JWT_SECRET is configured). Cached for just under the URL lifetime
+# (a minute less, or half of it for short lifetimes, so a cached URL is never
+# already expired); the key is the sorted path set, so a new recording changes
+# the key and no explicit invalidation is needed.
+@st.cache_data(ttl=max(1, SIGNED_SECONDS - min(60, SIGNED_SECONDS // 2)), show_spinner=False)
+def signed_urls(paths: tuple) -> dict:
+    if not paths:
+        return {}
+    if JWT_SECRET:
+        return sign_locally(paths)
+    signed = supabase.storage.from_(BUCKET).create_signed_urls(list(paths), SIGNED_SECONDS)
+    return {s["path"]: s["signedURL"] for s in signed if s.get("signedURL")}
+
+# Only the clip the user chose to play gets a URL and an audio element; the
+# other rows render as text plus a button.
+def _open_clip(path: str) -> None:
+    st.session_state["playback_open"] = path
+
+open_path = st.session_state.get("playback_open")
+try:
+    url_by_path = signed_urls((open_path,)) if open_path else {}
+    signed_err = None
+except Exception as e:
+    url_by_path, signed_err = {}, e
 
-# Only keep rows that actually have audio
-rows = [r for r in rows if r.get("audio_path")]
 # ---------- List items ----------
 for r in rows:
-    ts_raw = r.get("timestamp")
-    try:
-        ts = datetime.fromisoformat(ts_raw.replace("Z", "+00:00")) if isinstance(ts_raw, str) else ts_raw
-    except Exception:
-        ts = ts_raw
+    # PostgREST timestamps are ISO strings; trimming to the second is all the
+    # label needs, no datetime parse per row
+    ts = (r.get("timestamp") or "—").replace("T", " ")[:19]
     label = f"{ts} • {r.get('room') or '—'} • {r.get('feedback_type') or '—'}"
+    path = r.get("audio_path")
 
-    with st.expander(label):
+    with st.expander(label, expanded=path is not None and path == open_path):
         st.write("Transcript:", r.get("feedback_text") or r.get("voice_transcript") or "—")
-        path = r.get("audio_path")
 
-        if path:
+        if not path:
+            st.caption("No audio_path stored for this row.")
+        elif path != open_path:
+            st.button("▶ Load audio", key=f"play_{r.get('id') or path}", on_click=_open_clip, args=(path,))
+        elif url_by_path.get(path):
             # Prefer signed URL (private bucket with service/anon if policy allows)
+            st.audio(url_by_path[path])
+        else:
+            # fall back to public URL if the bucket/object is public
             try:
-                signed = supabase.storage.from_(BUCKET).create_signed_url(path, SIGNED_SECONDS)
-                url = signed.get("signedURL")
-                if not url:
-                    # fall back to public URL if the bucket/object is public
-                    url = supabase.storage.from_(BUCKET).get_public_url(path)
+                url = supabase.storage.from_(BUCKET).get_public_url(path)
                 st.audio(url)
-            except Exception as e:
-                # Fall back to public URL attempt + show error if that also fails
-                try:
-                    url = supabase.storage.from_(BUCKET).get_public_url(path)
-                    st.audio(url)
-                    st.caption("Used public URL (signed URL not available).")
-                except Exception as e2:
-                    st.error(f"Could not load audio: {e} / {e2}")
-        else:
-            st.caption("No audio_path stored for this row.")
+                st.caption("Used public URL (signed URL not available).")
+            except Exception as e2:
+                st.error(f"Could not load audio: {signed_err or 'no signed URL'} / {e2}")
+
+p1, p2 = st.columns(2)
+p1.button("← Newer", on_click=_turn_page, args=(-1,), disabled=page <= 1)
+p2.button("Older →", on_click=_turn_page, args=(1,), disabled=len(rows) < PAGE_SIZE)
 # -------------------- end file --------------------
@@ -0,0 +1,28 @@
+-- Indexes backing the filtered, newest-first queries in pages/.
+-- Run in the Supabase SQL editor, one statement at a time
+-- (CREATE INDEX CONCURRENTLY cannot run inside a transaction block).
+
+-- 02_Sensors.py: device/room equality filters + "timestamp" range and order.
+create index concurrently if not exists sensor_readings_dev_room_ts_idx
+    on public.sensor_readings (device_id, room, "timestamp" desc);
+
+-- 03_Voice_Playback.py: only rows that carry a recording, newest first.
+create index concurrently if not exists feedback_audio_ts_idx
+    on public.feedback ("timestamp" desc)
+    where audio_path is not null;
+
+-- 03_Voice_Playback.py type filter: equality on feedback_type, then the same
+-- newest-first order. Only for tables that still have feedback_type.
+create index concurrently if not exists feedback_type_audio_ts_idx
+    on public.feedback (feedback_type, "timestamp" desc)
+    where audio_path is not null;
+
+-- 03_Voice_Playback.py room filter is a contains match (ilike '%room%');
+-- trigram GIN lets it use an index instead of a sequential scan.
+create extension if not exists pg_trgm;
+create index concurrently if not exists feedback_room_trgm_idx
+    on public.feedback using gin (room gin_trgm_ops);
+
+-- Batched inserts (the pending_rows flush in 02_Sensors.py): vacuum/analyze
+-- sooner so planner stats keep up with bulk writes.
+alter table public.sensor_readings set (autovacuum_vacuum_scale_factor = 0.05);
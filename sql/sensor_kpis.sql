@@ -0,0 +1,37 @@
+-- KPIs and pre-binned series for pages/02_Sensors.py.
+-- Run once in the Supabase SQL editor; the page falls back to computing
+-- these in pandas when the function is missing.
+create or replace function public.sensor_kpis(
+    p_cut    timestamptz,
+    p_dev    text     default null,
+    p_room   text     default null,
+    p_bucket interval default '30 minutes'
+)
+returns jsonb
+language sql
+stable
+as $$
+    with filtered as (
+        select "timestamp" as ts, device_id, temp_c, rh_percent, co2_ppm, lux
+        from public.sensor_readings
+        where "timestamp" >= p_cut
+          and (p_dev  is null or device_id::text = p_dev)
+          and (p_room is null or room::text      = p_room)
+    ),
+    binned as (
+        select date_bin(p_bucket, ts, timestamptz '2000-01-01') as bin,
+               avg(temp_c)     as temp_c,
+               avg(rh_percent) as rh_percent,
+               avg(co2_ppm)    as co2_ppm,
+               avg(lux)        as lux
+        from filtered
+        group by 1
+    )
+    select jsonb_build_object(
+        'rows',    (select count(*) from filtered),
+        'devices', (select count(distinct device_id) from filtered),
+        'avg_co2', (select avg(co2_ppm) from filtered),
+        'avg_lux', (select avg(lux) from filtered),
+        'series',  coalesce((select jsonb_agg(b order by b.bin) from binned b), '[]'::jsonb)
+    );
+$$;
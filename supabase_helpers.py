@@ -0,0 +1,66 @@
+import socket
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+import httpx
+import streamlit as st
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=40, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+
+
+def _pooled_session(default: httpx.Client, timeout) -> httpx.Client:
+    # Same base URL/auth headers as the library's session, but HTTP/2 with a
+    # long-lived keep-alive pool and connect retries.
+    session = httpx.Client(
+        base_url=default.base_url,
+        headers=default.headers,
+        timeout=timeout,
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(http2=True, limits=HTTP_LIMITS, retries=3),
+    )
+    default.close()
+    return session
+
+
+def use_pooled_http(client: "Client") -> "Client":
+    pg = client.postgrest
+    pg.session = _pooled_session(pg.session, HTTP_TIMEOUT)
+
+    # Storage keeps its own (longer) timeout so audio uploads aren't cut off
+    storage = client.storage
+    storage._client = _pooled_session(storage._client, storage._client.timeout)
+    return client
+
+
+# One pooled client per process, shared by app.py and every page. supabase-py
+# drags in gotrue/postgrest/storage3/realtime, so it's imported on first use.
+@st.cache_resource
+def get_supabase() -> "Client":
+    from supabase import create_client
+
+    url = st.secrets["SUPABASE_URL"].strip().rstrip("/")
+    return use_pooled_http(create_client(url, st.secrets["SUPABASE_KEY"].strip()))
+
+
+# Connectivity probe shared by every page: DNS + a one-row select, run once
+# per (url, table) every 5 minutes. Failures raise and are not cached.
+@st.cache_resource(ttl=300, show_spinner=False)
+def probe_supabase(_client: "Client", url: str, table: str, column: str = "id") -> str:
+    ip = socket.gethostbyname(urlparse(url).hostname or "")
+    _client.table(table).select(column).limit(1).execute()
+    return ip
+
+
+# Narrow select list for a table whose schema has drifted over time: the
+# wanted columns that exist on a sample row, re-checked hourly ("*" until the
+# table has any rows).
+@st.cache_resource(ttl=3600, show_spinner=False)
+def select_columns(_client: "Client", table: str, wanted: tuple) -> str:
+    sample = _client.table(table).select("*").limit(1).execute().data
+    if not sample:
+        return "*"
+    return ",".join(c for c in wanted if c in sample[0]) or "*"
@@ -0,0 +1,86 @@
+# Fixed option lists, labels and colors for the survey pages.
+# Streamlit re-executes page scripts on every rerun, so constants defined
+# there are rebuilt each time; this module is imported once per process.
+
+PARTICIPANT_TYPES = ("Core group", "Visitor")
+
+THERMAL_LABELS = {
+    -3: "Cold",
+    -2: "Cool",
+    -1: "Slightly cool",
+     0: "Neutral",
+     1: "Slightly warm",
+     2: "Warm",
+     3: "Hot",
+}
+
+# Thermal sensation is a dense -3..+3 scale, so colors are a tuple indexed by v+3
+THERMAL_COLORS = ("#1e3a8a", "#2563eb", "#60a5fa", "#e5e7eb", "#fdba74", "#f97316", "#dc2626")
+THERMAL_LEGEND_STOPS = (
+    "#1e3a8a 0%", "#2563eb 16.6%", "#60a5fa 33.3%", "#e5e7eb 50%",
+    "#fdba74 66.6%", "#f97316 83.3%", "#dc2626 100%",
+)
+THERMAL_LEGEND_LABELS = tuple(THERMAL_LABELS.values())
+
+
+def thermal_color(v: int) -> str:
+    return THERMAL_COLORS[v + 3]
+
+
+COMFORT_OPTIONS = ("Comfortable", "Slightly uncomfortable", "Uncomfortable")
+THERMAL_PREFERENCE_OPTIONS = ("Cooler", "No change", "Warmer")
+BRIGHTNESS_OPTIONS = ("Too dim", "Comfortable", "Too bright")
+
+GLARE_COLORS = {
+    "None": "#16a34a",
+    "Slight": "#84cc16",
+    "Moderate": "#f59e0b",
+    "Severe": "#ef4444",
+}
+GLARE_LEVELS = tuple(GLARE_COLORS)
+GLARE_DISCOMFORT = frozenset({"Moderate", "Severe"})
+
+YES_NO = ("Yes", "No")
+
+TIME_IN_SPACE_OPTIONS = (
+    "Less than 15 minutes",
+    "15–60 minutes",
+    "1–3 hours",
+    "More than 3 hours",
+)
+
+FEEDBACK_INFLUENCE_OPTIONS = ("Not at all", "Slightly", "Moderately", "Strongly")
+
+AUDIO_UPLOAD_TYPES = ("wav", "mp3", "m4a")
+
+# ---------- Extended survey ----------
+SYMPTOM_QUESTIONS = (
+    "Have you had wheezing or whistling in your chest today?",
+    "Have you felt short of breath while sitting or working indoors?",
+    "Have you coughed during your time in this room?",
+    "Have you had a blocked or runny nose indoors?",
+    "Have you experienced itchy or watery eyes while indoors?",
+    "Have you felt your throat was dry or irritated?",
+    "Have you noticed any musty or damp smell?",
+    "Have you had a headache while in this space?",
+    "Have you felt unusually warm or cold in this space?",
+    "Have you felt your concentration or mood was affected by the indoor environment?",
+)
+
+SATISFACTION_QUESTIONS = (
+    ("overall", "How satisfied are you with the overall indoor environment of the classroom/studio?"),
+    ("privacy", "How satisfied are you with the level of privacy during class or studio work?"),
+    ("layout", "How satisfied are you with the layout and spatial organization of the classroom/studio?"),
+    ("appearance", "How satisfied are you with the color, decoration, or visual appearance of the space?"),
+    ("airmove", "How satisfied are you with the air movement or ventilation in the space?"),
+    ("clean", "How satisfied are you with the cleanliness and hygiene of the environment?"),
+    ("view", "How satisfied are you with the outdoor view or visual connection to the outside environment?"),
+)
+
+WHO5_ITEMS = (
+    ("who1", "I have felt cheerful and in good spirits."),
+    ("who2", "I have felt calm and relaxed."),
+    ("who3", "I have felt active and vigorous."),
+    ("who4", "I woke up feeling fresh and rested."),
+    ("who5", "My daily life has been filled with things that interest me."),
+)
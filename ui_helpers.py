@@ -1,114 +1,175 @@
+from functools import lru_cache
+from string import Template
+from typing import List
+
+import pandas as pd
 import streamlit as st
 
+from survey_options import THERMAL_LEGEND_LABELS, THERMAL_LEGEND_STOPS, WHO5_ITEMS
+
+# Static markup lives in module-level templates; the formatted HTML is memoized
+# because the inputs come from small discrete option sets. These live here rather
+# than in the page scripts, which Streamlit re-executes (and so re-creates) on
+# every rerun. Styling comes from the .legend/.chip/.metric-* classes in
+# style.css; only per-call values (gradient, height, dot colour) stay inline.
+_LEGEND_TPL = Template(
+    '<div class="legend"><div class="legend-bar" style="height:${height}px;background:${bar}"></div>'
+    '<div class="legend-ticks">${ticks}</div></div>'
+)
+
+_CHIP_TPL = Template(
+    '<div class="chip"><span class="chip-dot" style="background:${color}"></span>'
+    '<span class="chip-text">${icon} ${text}</span></div>'
+)
+
+_CARD_TPL = Template(
+    '<div class="metric-box"><div class="metric-label">${icon} ${title}</div>'
+    '<div class="metric-value">${value}</div><div class="metric-sub">${sub}</div></div>'
+)
+
+@lru_cache(maxsize=64)
+def legend_html(colors: tuple, labels: tuple, height: int) -> str:
+    return _LEGEND_TPL.substitute(
+        height=height,
+        bar=f"linear-gradient(90deg, {', '.join(colors)})",
+        ticks="".join(f"<span>{lbl}</span>" for lbl in labels),
+    )
+
+@lru_cache(maxsize=64)
+def chip_html(color: str, text: str, icon: str) -> str:
+    return _CHIP_TPL.substitute(color=color, text=text, icon=icon)
+
+@lru_cache(maxsize=256)
+def metric_card_html(title: str, value: str, sub: str, icon: str) -> str:
+    return _CARD_TPL.substitute(title=title, value=value, sub=sub, icon=icon)
+
+# Pure HTML goes through st.html, which skips the frontend markdown pipeline
+def chip(color: str, text: str, icon: str = "") -> None:
+    st.html(chip_html(color, text, icon))
+
+# All cards in one element laid out by .metric-grid
+def metric_cards(cards: List[tuple]) -> None:
+    body = "".join(metric_card_html(*card) for card in cards)
+    st.html(f'<div class="metric-grid">{body}</div>')
+
+# The thermal legend never changes, so build it once per process
+THERMAL_LEGEND_HTML = legend_html(THERMAL_LEGEND_STOPS, THERMAL_LEGEND_LABELS, 10)
+
+
+# Starting tables for the matrices, built once per question set. Question sets
+# are tuples (hashable); st.data_editor copies its input, so sharing is safe.
+@lru_cache(maxsize=8)
+def _yes_no_table(questions: tuple, key_prefix: str) -> pd.DataFrame:
+    codes = [f"{key_prefix}{idx:02d}" for idx in range(1, len(questions) + 1)]
+    return pd.DataFrame({"Question": list(questions), "Yes": [False] * len(questions)}, index=codes)
+
+
+@lru_cache(maxsize=8)
+def _likert_table(questions: tuple, key_prefix: str) -> pd.DataFrame:
+    codes = [f"{key_prefix}_{key}" for key, _ in questions]
+    return pd.DataFrame({"Question": [text for _, text in questions], "1–5": [3] * len(questions)}, index=codes)
+
+
+_WHO5_TABLE = pd.DataFrame(
+    {"Question": [text for _, text in WHO5_ITEMS], "0–5": [3] * len(WHO5_ITEMS)},
+    index=[key for key, _ in WHO5_ITEMS],
+)
+
+
 def yes_no_matrix(title, questions, key_prefix):
     st.header(title)
     st.caption("Modeled on the ECRHS style (tick Yes/No).")
-    h1, h2 = st.columns([4, 2])
-    with h1:
-        st.markdown("**Question**")
-    with h2:
-        st.markdown("**Response**")
-
-    out = {}
-    for idx, text in enumerate(questions, start=1):
-        c1, c2 = st.columns([4, 2])
-        with c1:
-            st.markdown(text)
-        with c2:
-            v = st.radio(
-                label=f"{key_prefix}_{idx}",
-                options=["Yes", "No"],
-                index=1,
-                horizontal=True,
-                label_visibility="collapsed",
-                key=f"{key_prefix}_r{idx}",
-            )
-            out[f"{key_prefix}{idx:02d}"] = (v == "Yes")
-
-    st.markdown("---")
+
+    # One data_editor for the whole block instead of one radio per question
+    edited = st.data_editor(
+        _yes_no_table(questions, key_prefix),
+        column_config={
+            "Question": st.column_config.TextColumn("Question", width="large"),
+            "Yes": st.column_config.CheckboxColumn("Yes", help="Tick for Yes, leave blank for No"),
+        },
+        disabled=["Question"],
+        hide_index=True,
+        use_container_width=True,
+        key=f"{key_prefix}_editor",
+    )
+
+    out = {code: bool(v) for code, v in edited["Yes"].items()}
+
+    st.divider()
     return out
 
 
 def likert_matrix(title, questions, key_prefix):
     st.header(title)
     st.caption("Scale: 1 = very dissatisfied … 5 = very satisfied")
-    h1, h2 = st.columns([4, 2])
-    with h1:
-        st.markdown("**Question**")
-    with h2:
-        st.markdown("**1–5**")
-
-    out = {}
-    for key, text in questions:
-        c1, c2 = st.columns([4, 2])
-        with c1:
-            st.markdown(text)
-        with c2:
-            score = st.slider(
-                label=f"{key_prefix}_{key}",
-                min_value=1,
-                max_value=5,
-                value=3,
-                label_visibility="collapsed",
-                key=f"{key_prefix}_{key}_slider",
-            )
-            out[f"{key_prefix}_{key}"] = int(score)
 
-    st.markdown("---")
+    edited = st.data_editor(
+        _likert_table(questions, key_prefix),
+        column_config={
+            "Question": st.column_config.TextColumn("Question", width="large"),
+            "1–5": st.column_config.NumberColumn("1–5", min_value=1, max_value=5, step=1, required=True),
+        },
+        disabled=["Question"],
+        hide_index=True,
+        use_container_width=True,
+        key=f"{key_prefix}_editor",
+    )
+
+    out = {code: int(v) for code, v in edited["1–5"].items()}
+
+    st.divider()
     return out
 
 
+# Only 26 possible scores, so the interpretation is memoized per process
+@lru_cache(maxsize=None)
+def who5_tip(scaled: int) -> str:
+    tip = "✅ ≥ 50 suggests acceptable well-being."
+    if scaled < 50:
+        tip = "⚠️ < 50 suggests reduced well-being; consider follow-up."
+    if scaled < 28:
+        tip += " **< 28 is a common depression-screening cut-off.**"
+    return tip
+
+
 def who5_matrix(title="Well-Being (WHO-5)"):
     st.header(title)
     st.caption("In the last 2 weeks, how often have you felt the following? 5 = All of the time … 0 = At no time")
 
-    hq, h5, h4, h3, h2, h1, h0 = st.columns([4, 1, 1, 1, 1, 1, 1])
-    with hq:
-        st.markdown("**Question**")
-    for c, lab in zip(
-        [h5, h4, h3, h2, h1, h0],
-        [
-            "**5**<br/>All of the time",
-            "**4**<br/>Most of the time",
-            "**3**<br/>More than half",
-            "**2**<br/>Less than half",
-            "**1**<br/>Some of the time",
-            "**0**<br/>At no time",
-        ],
-    ):
-        c.markdown(lab, unsafe_allow_html=True)
-
-    items = [
-        ("who1", "I have felt **cheerful and in good spirits**."),
-        ("who2", "I have felt **calm and relaxed**."),
-        ("who3", "I have felt **active and vigorous**."),
-        ("who4", "I **woke up feeling fresh** and rested."),
-        ("who5", "My **daily life** has been filled with **things that interest me**."),
-    ]
-
-    answers = {}
-    for key, text in items:
-        c_q, c5, c4, c3, c2, c1, c0 = st.columns([4, 1, 1, 1, 1, 1, 1])
-        with c_q:
-            st.markdown(text)
-        val = st.slider(f"{key}_slider", 0, 5, 3, label_visibility="collapsed", key=f"who5_{key}")
-        for v, col in zip([5, 4, 3, 2, 1, 0], [c5, c4, c3, c2, c1, c0]):
-            col.markdown("●" if val == v else "○")
-        answers[key] = int(val)
+    # Same single-editor layout as the Likert block instead of a columns row per item
+    edited = st.data_editor(
+        _WHO5_TABLE,
+        column_config={
+            "Question": st.column_config.TextColumn("Question", width="large"),
+            "0–5": st.column_config.NumberColumn(
+                "0–5",
+                help="5 All of the time · 4 Most of the time · 3 More than half · "
+                     "2 Less than half · 1 Some of the time · 0 At no time",
+                min_value=0,
+                max_value=5,
+                step=1,
+                required=True,
+            ),
+        },
+        disabled=["Question"],
+        hide_index=True,
+        use_container_width=True,
+        key="who5_editor",
+    )
+
+    answers = {key: int(v) for key, v in edited["0–5"].items()}
 
     raw_sum = sum(answers.values())
     scaled = raw_sum * 4
 
-    st.markdown("---")
+    st.divider()
+    return answers, raw_sum, scaled
+
+
+# Rendered outside the survey form: inside one, the score would only update
+# after submit
+def who5_score(raw_sum: int, scaled: int) -> None:
     st.subheader("WHO-5 Score")
     st.write(f"Raw: **{raw_sum}/25**  ·  Scaled: **{scaled}/100**")
 
-    tip = "✅ ≥ 50 suggests acceptable well-being."
-    if scaled < 50:
-        tip = "⚠️ < 50 suggests reduced well-being; consider follow-up."
-    if scaled < 28:
-        tip += " **< 28 is a common depression-screening cut-off.**"
-
-    st.caption(tip)
-    st.markdown("---")
-    return answers, raw_sum, scaled
+    st.caption(who5_tip(scaled))